@@ -0,0 +1,132 @@
+"""
+Minimal triton stub for platforms without triton (e.g. macOS)
+
+SAM3 imports triton at module load time. Importing this module registers
+no-op replacements for the parts of triton it touches in sys.modules. It
+must be imported before any SAM3 imports.
+"""
+import sys
+import types
+
+# Helper to create a stub module that acts as both module and package
+def create_stub_module(name, is_package=False):
+    mod = types.ModuleType(name)
+    mod.__file__ = '<triton_stub>'
+    if is_package:
+        mod.__path__ = []
+    return mod
+
+# Create main triton package
+triton = create_stub_module('triton', is_package=True)
+
+# Create triton.language module with common attributes
+tl = create_stub_module('triton.language')
+tl.constexpr = lambda x=None: x if x is not None else (lambda f: f)
+tl.program_id = lambda axis: 0
+tl.num_programs = lambda axis: 1
+tl.load = lambda *a, **kw: None
+tl.store = lambda *a, **kw: None
+tl.arange = lambda *a, **kw: None
+tl.zeros = lambda *a, **kw: None
+tl.cdiv = lambda a, b: (a + b - 1) // b
+tl.sigmoid = lambda x: x
+tl.log = lambda x: x
+tl.exp = lambda x: x
+tl.abs = lambda x: x
+tl.clamp = lambda x, **kw: x
+tl.cast = lambda x, t: x
+tl.reduce = lambda *a, **kw: None
+tl.debug_barrier = lambda: None
+tl.tensor = type('tensor', (), {})
+tl.int1 = 'int1'
+tl.int32 = 'int32'
+tl.int64 = 'int64'
+tl.uint8 = 'uint8'
+tl.uint32 = 'uint32'
+tl.float16 = 'float16'
+tl.float32 = 'float32'
+tl.bool = 'bool'
+# dtype class for type annotations
+class dtype:
+    float32 = 'float32'
+    float16 = 'float16'
+    int32 = 'int32'
+    int64 = 'int64'
+    uint8 = 'uint8'
+    uint32 = 'uint32'
+    bool = 'bool'
+tl.dtype = dtype
+triton.language = tl
+
+# Create triton.compiler package and submodules
+compiler_pkg = create_stub_module('triton.compiler', is_package=True)
+compiler_compiler = create_stub_module('triton.compiler.compiler')
+compiler_compiler.CompiledKernel = type('CompiledKernel', (), {})
+compiler_compiler.compile = lambda *a, **kw: lambda f: f
+compiler_pkg.compiler = compiler_compiler
+compiler_pkg.CompiledKernel = compiler_compiler.CompiledKernel
+compiler_pkg.compile = compiler_compiler.compile
+triton.compiler = compiler_pkg
+
+# Create triton.backends package and submodules
+backends_pkg = create_stub_module('triton.backends', is_package=True)
+backends_compiler = create_stub_module('triton.backends.compiler')
+backends_compiler.compile = lambda *a, **kw: lambda f: f
+backends_pkg.compiler = backends_compiler
+triton.backends = backends_pkg
+
+# Create triton.runtime module
+runtime = create_stub_module('triton.runtime', is_package=True)
+runtime.driver = create_stub_module('triton.runtime.driver')
+runtime.jit = create_stub_module('triton.runtime.jit')
+triton.runtime = runtime
+
+# Kernel callable class for @triton.jit decorated functions
+def _noop_launcher(*args, **kwargs):
+    pass  # No-op on CPU
+
+class KernelStub:
+    def __getitem__(self, grid):
+        return _noop_launcher
+    def __call__(self, *args, **kwargs):
+        pass
+
+# Every kernel is a no-op, so all @triton.jit functions share one stub
+_KERNEL_STUB = KernelStub()
+
+# @triton.jit decorator
+def jit(*args, **kwargs):
+    def decorator(func):
+        return _KERNEL_STUB
+    if args and callable(args[0]):
+        return _KERNEL_STUB
+    return decorator
+triton.jit = jit
+
+# @triton.autotune decorator
+def autotune(*args, **kwargs):
+    def decorator(func):
+        return func
+    if args and callable(args[0]):
+        return args[0]
+    return decorator
+triton.autotune = autotune
+
+# triton.Config class
+class Config:
+    def __init__(self, kwargs=None, **kw):
+        if kwargs:
+            self.__dict__.update(kwargs)
+        self.__dict__.update(kw)
+triton.Config = Config
+
+# Register ALL modules in sys.modules
+sys.modules['triton'] = triton
+sys.modules['triton.language'] = tl
+sys.modules['triton.compiler'] = compiler_pkg
+sys.modules['triton.compiler.compiler'] = compiler_compiler
+sys.modules['triton.backends'] = backends_pkg
+sys.modules['triton.backends.compiler'] = backends_compiler
+sys.modules['triton.runtime'] = runtime
+sys.modules['triton.runtime.driver'] = runtime.driver
+sys.modules['triton.runtime.jit'] = runtime.jit
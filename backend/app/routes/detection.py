@@ -1,14 +1,43 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any
 from PIL import Image
-import base64
+import numpy as np
+import asyncio
+import binascii
 import io
+import logging
+import os
+import tempfile
+import threading
 from app.services.sam3_service import SAM3Service
 from app.services.coordinate_converter import convert_sam3_results_to_geojson
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+# Save the decoded input image to /tmp on every request (debugging only)
+DEBUG_SAVE_IMAGE = os.getenv("SAM3_DEBUG_SAVE", "false").lower() in ("1", "true")
+DEBUG_IMAGE_PATH = "/tmp/sam3_debug_image.png"
+
+
+def _save_debug_image(image: Image.Image, path: str):
+    """Write image to a temp file and rename it into place atomically"""
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix=".png")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            image.save(f, format="PNG")
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning("Failed to save debug image to %s: %s", path, e)
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
 
 class PromptRequest(BaseModel):
     text: str
@@ -23,10 +52,12 @@ class DetectionRequest(BaseModel):
     confidence: float = 0.5
 
 
-@router.post("/detect")
-async def detect_objects(request: DetectionRequest):
+def _run_detection(request: DetectionRequest) -> Dict[str, Any]:
     """
-    Detect objects in an image using SAM3
+    Decode the request image, run SAM3 and convert the results to GeoJSON
+    
+    This is blocking CPU/GPU work and is run in a worker thread by
+    detect_objects so it doesn't stall the event loop.
     
     Args:
         request: Detection request with image, prompts, bounds, and confidence
@@ -34,75 +65,108 @@ async def detect_objects(request: DetectionRequest):
     Returns:
         GeoJSON FeatureCollection with detected objects
     """
+    # Decode base64 image
     try:
-        # Decode base64 image
-        try:
-            image_data = base64.b64decode(request.image.split(",")[-1])
-            image = Image.open(io.BytesIO(image_data))
-            
-            # Convert to RGB if image has alpha channel (RGBA -> RGB)
-            # SAM3 expects 3-channel RGB images
-            if image.mode == 'RGBA':
-                # Create white background and composite
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                background.paste(image, mask=image.split()[3])  # Use alpha as mask
-                image = background
-            elif image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            print(f"Image size: {image.size}, mode: {image.mode}")
-            
-            # Save image for debugging
-            debug_path = "/tmp/sam3_debug_image.png"
-            image.save(debug_path)
-            print(f"DEBUG: Saved image to {debug_path}")
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid image data: {str(e)}")
-        
-        # Get SAM3 service instance
-        service = SAM3Service.get_instance()
-        
-        # Load model if not loaded
-        if not service.is_model_loaded():
-            service.load_model()
-        
-        if not service.is_model_loaded():
-            raise HTTPException(
-                status_code=503,
-                detail="SAM3 model is not available. Please check model installation."
-            )
-        
-        # Extract prompts
-        prompt_texts = [p.text for p in request.prompts]
-        prompt_colors = [p.color for p in request.prompts]
-        
-        # Process image with SAM3
-        results = service.process_image(
-            image=image,
-            prompts=prompt_texts,
-            confidence_threshold=request.confidence
+        # Strip the optional data URL prefix without splitting the payload
+        data = request.image
+        comma = data.find(",")
+        payload = data[comma + 1:] if comma >= 0 else data
+        image_data = binascii.a2b_base64(payload)
+        image = Image.open(io.BytesIO(image_data))
+        image.load()  # Decode now so errors surface as a 400
+
+        # Convert to RGB if image has alpha channel (RGBA -> RGB)
+        # SAM3 expects 3-channel RGB images
+        if image.mode == 'RGBA':
+            rgba = np.asarray(image)
+            alpha = rgba[..., 3:4]
+            if alpha.min() == 255:
+                # Fully opaque (the common case): just drop the alpha channel
+                image = Image.fromarray(np.ascontiguousarray(rgba[..., :3]), 'RGB')
+            else:
+                # Composite onto a white background
+                a = alpha.astype(np.float32) * (1 / 255)
+                blended = rgba[..., :3] * a + 255 * (1 - a)
+                image = Image.fromarray((blended + 0.5).astype(np.uint8), 'RGB')
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        logger.debug("Image size: %s, mode: %s", image.size, image.mode)
+
+        # Save image for debugging, off the request path
+        if DEBUG_SAVE_IMAGE:
+            threading.Thread(
+                target=_save_debug_image,
+                args=(image, DEBUG_IMAGE_PATH),
+                daemon=True
+            ).start()
+            logger.debug("Saving image to %s", DEBUG_IMAGE_PATH)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image data: {str(e)}")
+
+    # Get SAM3 service instance
+    service = SAM3Service.get_instance()
+
+    # Load model if not loaded
+    if not service.is_model_loaded():
+        service.load_model()
+
+    if not service.is_model_loaded():
+        raise HTTPException(
+            status_code=503,
+            detail="SAM3 model is not available. Please check model installation."
         )
-        
-        # Log detection results for debugging
+
+    # Extract prompts
+    prompt_texts = [p.text for p in request.prompts]
+    prompt_colors = [p.color for p in request.prompts]
+
+    # Process image with SAM3
+    results = service.process_image(
+        image=image,
+        prompts=prompt_texts,
+        confidence_threshold=request.confidence
+    )
+
+    # Log detection results for debugging
+    if logger.isEnabledFor(logging.DEBUG):
         total_detections = sum(len(scores) for scores in results.get("scores", []))
-        print(f"SAM3 found {total_detections} detections for prompts: {prompt_texts}")
+        logger.debug("SAM3 found %d detections for prompts: %s", total_detections, prompt_texts)
         for i, prompt in enumerate(results.get("prompts", [])):
             masks = results.get("masks", [])[i] if i < len(results.get("masks", [])) else []
             scores = results.get("scores", [])[i] if i < len(results.get("scores", [])) else []
-            print(f"  - '{prompt}': {len(masks)} masks, {len(scores)} scores")
-        
-        # Convert results to GeoJSON
-        geojson_data = convert_sam3_results_to_geojson(
-            results=results,
-            image_width=image.width,
-            image_height=image.height,
-            bounds=request.bounds,
-            colors=prompt_colors
-        )
-        
-        print(f"GeoJSON: {len(geojson_data.get('features', []))} features")
+            logger.debug("  - '%s': %d masks, %d scores", prompt, len(masks), len(scores))
+
+    # Convert results to GeoJSON
+    geojson_data = convert_sam3_results_to_geojson(
+        results=results,
+        image_width=image.width,
+        image_height=image.height,
+        bounds=request.bounds,
+        colors=prompt_colors
+    )
+
+    logger.debug("GeoJSON: %d features", len(geojson_data.get('features', [])))
+
+    return geojson_data
+
+
+@router.post("/detect", response_class=ORJSONResponse)
+async def detect_objects(request: DetectionRequest):
+    """
+    Detect objects in an image using SAM3
+    
+    Args:
+        request: Detection request with image, prompts, bounds, and confidence
         
-        return geojson_data
+    Returns:
+        GeoJSON FeatureCollection with detected objects
+    """
+    try:
+        geojson_data = await asyncio.to_thread(_run_detection, request)
+        # Return the response directly so the numpy coordinate arrays go
+        # straight to orjson instead of through jsonable_encoder
+        return ORJSONResponse(geojson_data)
         
     except HTTPException:
         raise
@@ -1,7 +1,13 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
 import geojson
 
+logger = logging.getLogger(__name__)
+
 # Try to import shapely, but make it optional
 try:
     from shapely.geometry import Polygon, Point
@@ -12,6 +18,29 @@ except ImportError:
     Polygon = None
     Point = None
 
+# Prefer OpenCV's C++ contour tracer, fall back to scikit-image. Both are
+# optional; without either, masks are approximated by bounding boxes.
+try:
+    import cv2
+    HAS_CV2 = True
+except ImportError:
+    HAS_CV2 = False
+
+HAS_SKIMAGE = False
+if not HAS_CV2:
+    try:
+        from skimage import measure
+        HAS_SKIMAGE = True
+    except ImportError:
+        HAS_SKIMAGE = False
+
+# Try to import numba for the bounding-box kernel, but make it optional
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
 def pixel_to_geo(
     pixel_x: float,
     pixel_y: float,
@@ -43,148 +72,414 @@ def pixel_to_geo(
     return (lon, lat)
 
 
-def mask_to_polygons(
+# Decimal places kept in emitted coordinates (6 decimals is ~11cm)
+COORDINATE_PRECISION = 6
+
+# Masks with fewer foreground pixels than this can't form a useful polygon
+MIN_MASK_PIXELS = 10
+
+# Douglas-Peucker epsilon is capped at this fraction of a contour's
+# perimeter so small detections are not collapsed away at high zoom
+SIMPLIFY_MAX_PERIMETER_FRACTION = 0.01
+
+# Masks are converted in parallel once there are at least this many
+PARALLEL_MIN_MASKS = 4
+MAX_CONVERSION_WORKERS = min(8, os.cpu_count() or 1)
+
+# Shared across requests; created on first use by _get_conversion_executor
+_conversion_executor: Optional[ThreadPoolExecutor] = None
+_conversion_executor_lock = threading.Lock()
+
+# Contours with more vertices than this, or filling less than this fraction
+# of their bounding box, may self-intersect and are checked with shapely
+VALIDATE_MAX_VERTICES = 1000
+VALIDATE_MIN_FILL_RATIO = 0.1
+
+# numba's default workqueue threading layer can't run parallel kernels
+# from several threads at once
+_numba_lock = threading.Lock()
+
+
+class AffineParams(NamedTuple):
+    """Pixel -> geo transform: lon = west + sx * x, lat = north - sy * y"""
+    west: float
+    north: float
+    sx: float
+    sy: float
+
+
+def affine_params(
+    image_width: int,
+    image_height: int,
+    bounds: Dict[str, float]
+) -> AffineParams:
+    """
+    Precompute the pixel -> geo transform for an image
+    
+    Args:
+        image_width: Width of the image in pixels
+        image_height: Height of the image in pixels
+        bounds: Dictionary with 'north', 'south', 'east', 'west' keys
+        
+    Returns:
+        AffineParams for use with _pixels_to_lonlat
+    """
+    return AffineParams(
+        west=bounds['west'],
+        north=bounds['north'],
+        sx=(bounds['east'] - bounds['west']) / image_width,
+        sy=(bounds['north'] - bounds['south']) / image_height
+    )
+
+
+def _pixels_to_lonlat(
+    xs: np.ndarray,
+    ys: np.ndarray,
+    affine: AffineParams
+) -> np.ndarray:
+    """Convert pixel coordinate arrays to an (N, 2) array of (lon, lat)"""
+    lonlat = np.stack(
+        [affine.west + affine.sx * xs, affine.north - affine.sy * ys],
+        axis=1
+    )
+    # Quantize to shrink the serialized GeoJSON
+    return np.round(lonlat, COORDINATE_PRECISION, out=lonlat)
+
+
+if HAS_NUMBA:
+    @njit(cache=True, parallel=True, fastmath=True)
+    def _mask_bbox_numba(mask):
+        """Single fused pass over a 2D bool mask; returns -1s if empty"""
+        height, width = mask.shape
+        row_min_x = np.full(height, width, dtype=np.int64)
+        row_max_x = np.full(height, -1, dtype=np.int64)
+        for y in prange(height):
+            for x in range(width):
+                if mask[y, x]:
+                    if x < row_min_x[y]:
+                        row_min_x[y] = x
+                    row_max_x[y] = x
+        
+        min_y, max_y = -1, -1
+        min_x, max_x = width, -1
+        for y in range(height):
+            if row_max_x[y] >= 0:
+                if min_y < 0:
+                    min_y = y
+                max_y = y
+                min_x = min(min_x, row_min_x[y])
+                max_x = max(max_x, row_max_x[y])
+        if max_y < 0:
+            return -1, -1, -1, -1
+        return min_y, max_y, min_x, max_x
+
+
+def _mask_bbox(mask: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Compute the pixel bounding box of a mask
+    
+    Args:
+        mask: Mask array (values > 0.5 are foreground)
+        
+    Returns:
+        Tuple of (min_y, max_y, min_x, max_x), or None if the mask is empty
+    """
+    if mask.ndim > 2:
+        mask = mask.squeeze()
+    binary_mask = mask if mask.dtype == bool else mask > 0.5
+    
+    if HAS_NUMBA:
+        with _numba_lock:
+            min_y, max_y, min_x, max_x = _mask_bbox_numba(
+                np.ascontiguousarray(binary_mask)
+            )
+        if max_y < 0:
+            return None
+        return int(min_y), int(max_y), int(min_x), int(max_x)
+    
+    # NumPy fallback: reduce along each axis instead of materializing indices
+    rows = np.flatnonzero(binary_mask.any(axis=1))
+    if len(rows) == 0:
+        return None
+    cols = np.flatnonzero(binary_mask.any(axis=0))
+    return int(rows[0]), int(rows[-1]), int(cols[0]), int(cols[-1])
+
+
+def _get_conversion_executor() -> ThreadPoolExecutor:
+    """Return the shared mask conversion thread pool, creating it on first use"""
+    global _conversion_executor
+    if _conversion_executor is None:
+        with _conversion_executor_lock:
+            if _conversion_executor is None:
+                _conversion_executor = ThreadPoolExecutor(
+                    max_workers=MAX_CONVERSION_WORKERS,
+                    thread_name_prefix="mask-convert"
+                )
+    return _conversion_executor
+
+
+def _may_self_intersect(contour: np.ndarray) -> bool:
+    """
+    Cheap heuristic for whether a pixel contour might self-intersect
+    
+    Raster-derived contours are almost always simple closed curves, so
+    shapely validation is only worth running on very long contours or ones
+    whose shoelace area is a small fraction of their bounding box.
+    
+    Args:
+        contour: (N, 2) array of (x, y) pixel coordinates
+        
+    Returns:
+        True if the contour should be validated with shapely
+    """
+    if len(contour) > VALIDATE_MAX_VERTICES:
+        return True
+    
+    xs = contour[:, 0].astype(np.float64)
+    ys = contour[:, 1].astype(np.float64)
+    bbox_area = (xs.max() - xs.min()) * (ys.max() - ys.min())
+    if bbox_area == 0:
+        return True
+    
+    area = 0.5 * abs(np.dot(xs, np.roll(ys, 1)) - np.dot(ys, np.roll(xs, 1)))
+    return area / bbox_area < VALIDATE_MIN_FILL_RATIO
+
+
+def _polygon_feature(
+    ring: Any,
+    properties: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Build a GeoJSON Polygon feature from a single closed ring"""
+    feature = {
+        "type": "Feature",
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [ring]
+        }
+    }
+    if properties is not None:
+        feature["properties"] = properties
+    return feature
+
+
+def _bbox_polygons(
+    mask: np.ndarray,
+    image_width: int,
+    image_height: int,
+    bounds: Dict[str, float],
+    properties: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """Approximate a mask by its bounding box as a GeoJSON polygon feature"""
+    bbox = _mask_bbox(mask)
+    if bbox is None:
+        return []
+    
+    min_y, max_y, min_x, max_x = bbox
+    
+    # Convert corners to geo coordinates
+    corners = [
+        pixel_to_geo(min_x, min_y, image_width, image_height, bounds),
+        pixel_to_geo(max_x, min_y, image_width, image_height, bounds),
+        pixel_to_geo(max_x, max_y, image_width, image_height, bounds),
+        pixel_to_geo(min_x, max_y, image_width, image_height, bounds),
+        pixel_to_geo(min_x, min_y, image_width, image_height, bounds),  # Close
+    ]
+    corners = [
+        (round(lon, COORDINATE_PRECISION), round(lat, COORDINATE_PRECISION))
+        for lon, lat in corners
+    ]
+    
+    return [_polygon_feature(corners, properties)]
+
+
+def _mask_to_features(
     mask: np.ndarray,
     image_width: int,
     image_height: int,
     bounds: Dict[str, float],
-    simplify_tolerance: float = 0.0001
+    affine: Optional[AffineParams] = None,
+    properties: Optional[Dict[str, Any]] = None,
+    simplify_tolerance: float = 0.0001,
+    validate: bool = False,
+    packed: bool = False,
+    mask_width: Optional[int] = None
 ) -> List[Dict[str, Any]]:
     """
-    Convert a binary mask to GeoJSON polygons
+    Convert one mask straight to GeoJSON features in a single pass
+    
+    Contour tracing, simplification and the geo transform all operate on
+    the same NumPy buffers, and features are built with their properties
+    attached, so no intermediate per-stage lists are materialized.
     
     Args:
         mask: Binary mask array (0s and 1s)
         image_width: Width of the image
         image_height: Height of the image
         bounds: Map bounds dictionary
-        simplify_tolerance: Tolerance for polygon simplification
+        affine: Precomputed pixel -> geo transform (derived from bounds if omitted)
+        properties: Properties dict attached to every feature (omitted if None)
+        simplify_tolerance: Tolerance for polygon simplification (degrees)
+        validate: Drop polygons that fail shapely's validity check
+        packed: Mask is bit-packed along its width axis (see np.packbits)
+        mask_width: Unpacked width of a packed mask (defaults to image_width)
         
     Returns:
-        List of GeoJSON polygon features
+        List of GeoJSON polygon features (coordinates as ndarrays)
     """
-    try:
-        from scipy import ndimage
-        from skimage import measure
-        has_scipy = True
-    except ImportError:
-        has_scipy = False
+    # Empty masks (packed or not) need no further work
+    if mask.size == 0 or not mask.any():
+        return []
+    
+    if packed:
+        # Unpacked bits are 0/1 uint8, so they can be viewed as bool for free
+        count = image_width if mask_width is None else mask_width
+        mask = np.unpackbits(mask, axis=-1, count=count).view(bool)
+    
+    # Ensure mask is binary and 2D
+    if len(mask.shape) > 2:
+        mask = mask.squeeze()
+    if mask.dtype != bool:
+        binary_mask = mask > 0.5
+    else:
+        binary_mask = mask
+    
+    # Tiny detections can't form a useful polygon
+    if np.count_nonzero(binary_mask) < MIN_MASK_PIXELS:
+        return []
     
-    if not has_scipy:
+    if not HAS_CV2 and not HAS_SKIMAGE:
         # Fallback to bounding box approach
-        y_indices, x_indices = np.where(mask > 0.5)
-        if len(x_indices) == 0:
-            return []
-        
-        min_x, max_x = x_indices.min(), x_indices.max()
-        min_y, max_y = y_indices.min(), y_indices.max()
-        
-        # Convert corners to geo coordinates
-        corners = [
-            pixel_to_geo(min_x, min_y, image_width, image_height, bounds),
-            pixel_to_geo(max_x, min_y, image_width, image_height, bounds),
-            pixel_to_geo(max_x, max_y, image_width, image_height, bounds),
-            pixel_to_geo(min_x, max_y, image_width, image_height, bounds),
-            pixel_to_geo(min_x, min_y, image_width, image_height, bounds),  # Close
-        ]
-        
-        return [{
-            "type": "Feature",
-            "geometry": {
-                "type": "Polygon",
-                "coordinates": [corners]
-            }
-        }]
+        return _bbox_polygons(binary_mask, image_width, image_height, bounds, properties)
     
     try:
-        # Ensure mask is binary and 2D
-        if len(mask.shape) > 2:
-            mask = mask.squeeze()
-        if mask.dtype != bool:
-            binary_mask = mask > 0.5
+        # Find contours as (N, 2) arrays of (x, y) pixel coordinates
+        if HAS_CV2:
+            # findContours only needs non-zero foreground, so a contiguous
+            # bool mask can be handed over as uint8 without a copy
+            if binary_mask.flags.c_contiguous:
+                mask_u8 = binary_mask.view(np.uint8)
+            else:
+                mask_u8 = binary_mask.astype(np.uint8)
+            cv_contours, _ = cv2.findContours(
+                mask_u8, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_TC89_KCOS
+            )
+            # OpenCV returns (N, 1, 2) int32 arrays
+            contours = [c.reshape(-1, 2) for c in cv_contours]
         else:
-            binary_mask = mask
+            # scikit-image returns (row, col) = (y, x), flip to (x, y)
+            contours = [
+                c[:, ::-1] for c in measure.find_contours(binary_mask, 0.5)
+            ]
         
-        # Find contours
-        contours = measure.find_contours(binary_mask, 0.5)
+        # Pixel -> geo transform, shared by every contour of this mask
+        if affine is None:
+            affine = affine_params(image_width, image_height, bounds)
         
-        polygons = []
+        # Geo tolerance expressed in pixels for cv2.approxPolyDP. Pixels are
+        # not square in degrees, so use the finer of the two axis scales to
+        # never exceed the tolerance along either longitude or latitude.
+        pixel_scale = max(abs(affine.sx), abs(affine.sy))
+        pixel_tolerance = simplify_tolerance / pixel_scale if pixel_scale else 0.0
+        
+        features = []
         for contour in contours:
+            if HAS_CV2:
+                # Douglas-Peucker simplification in pixel space, with epsilon
+                # capped relative to the contour's own size
+                epsilon = min(
+                    pixel_tolerance,
+                    SIMPLIFY_MAX_PERIMETER_FRACTION * cv2.arcLength(contour, True)
+                )
+                simplified = cv2.approxPolyDP(
+                    contour, epsilon=epsilon, closed=True
+                ).reshape(-1, 2)
+                # Never let simplification collapse a detection to a line
+                if len(simplified) >= 3:
+                    contour = simplified
+            
             if len(contour) < 3:
                 continue
             
-            # Convert contour points to geographic coordinates
-            coords = []
-            for point in contour:
-                y_pixel, x_pixel = point
-                lon, lat = pixel_to_geo(
-                    x_pixel, y_pixel,
-                    image_width, image_height,
-                    bounds
-                )
-                coords.append([lon, lat])
+            # Only pay for GEOS validation on contours that look suspicious
+            suspicious = (
+                HAS_SHAPELY and (validate or not HAS_CV2)
+                and _may_self_intersect(contour)
+            )
+            
+            # Convert all contour points to geographic coordinates in one
+            # vectorized pass. Coordinates stay an (N, 2) ndarray; the API
+            # response is serialized with orjson's native numpy support.
+            coords = _pixels_to_lonlat(contour[:, 0], contour[:, 1], affine)
             
             # Close the polygon
-            if coords[0] != coords[-1]:
-                coords.append(coords[0])
+            if not np.array_equal(coords[0], coords[-1]):
+                coords = np.concatenate([coords, coords[:1]])
             
-            # Create polygon and simplify (if shapely is available)
-            if HAS_SHAPELY:
+            # Without OpenCV, simplify with shapely (if available)
+            if not HAS_CV2 and HAS_SHAPELY:
                 try:
                     poly = Polygon(coords)
-                    if poly.is_valid:
-                        # Simplify polygon
+                    # Topology-preserving simplification of a simple polygon
+                    # stays valid, so only suspicious contours are checked
+                    if not suspicious or poly.is_valid:
                         simplified = poly.simplify(simplify_tolerance, preserve_topology=True)
-                        if simplified.is_valid:
-                            coords_list = list(simplified.exterior.coords)
-                            polygons.append({
-                                "type": "Feature",
-                                "geometry": {
-                                    "type": "Polygon",
-                                    "coordinates": [coords_list]
-                                }
-                            })
-                            continue
+                        coords = np.asarray(simplified.exterior.coords)
                 except Exception as e:
                     # If polygon creation fails, use original coords
                     pass
             
-            # Use original coords (either shapely not available or simplification failed)
-            polygons.append({
-                "type": "Feature",
-                "geometry": {
-                    "type": "Polygon",
-                    "coordinates": [coords]
-                }
-            })
+            # Optionally drop polygons that shapely considers invalid
+            if validate and suspicious and not Polygon(coords).is_valid:
+                continue
+            
+            features.append(_polygon_feature(coords, properties))
         
-        return polygons
+        return features
     except Exception as e:
         # Fallback to bounding box if contour detection fails
-        print(f"Warning: Contour detection failed, using bounding box: {e}")
-        y_indices, x_indices = np.where(binary_mask)
-        if len(x_indices) == 0:
-            return []
-        
-        min_x, max_x = x_indices.min(), x_indices.max()
-        min_y, max_y = y_indices.min(), y_indices.max()
-        
-        # Convert corners to geo coordinates
-        corners = [
-            pixel_to_geo(min_x, min_y, image_width, image_height, bounds),
-            pixel_to_geo(max_x, min_y, image_width, image_height, bounds),
-            pixel_to_geo(max_x, max_y, image_width, image_height, bounds),
-            pixel_to_geo(min_x, max_y, image_width, image_height, bounds),
-            pixel_to_geo(min_x, min_y, image_width, image_height, bounds),  # Close
-        ]
+        logger.warning("Contour detection failed, using bounding box: %s", e)
+        return _bbox_polygons(binary_mask, image_width, image_height, bounds, properties)
+
+
+def mask_to_polygons(
+    mask: np.ndarray,
+    image_width: int,
+    image_height: int,
+    bounds: Dict[str, float],
+    simplify_tolerance: float = 0.0001,
+    validate: bool = False,
+    affine: Optional[AffineParams] = None,
+    packed: bool = False,
+    mask_width: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Convert a binary mask to GeoJSON polygons
+    
+    Args:
+        mask: Binary mask array (0s and 1s)
+        image_width: Width of the image
+        image_height: Height of the image
+        bounds: Map bounds dictionary
+        simplify_tolerance: Tolerance for polygon simplification (degrees)
+        validate: Drop polygons that fail shapely's validity check
+        affine: Precomputed pixel -> geo transform (derived from bounds if omitted)
+        packed: Mask is bit-packed along its width axis (see np.packbits)
+        mask_width: Unpacked width of a packed mask (defaults to image_width)
         
-        return [{
-            "type": "Feature",
-            "geometry": {
-                "type": "Polygon",
-                "coordinates": [corners]
-            }
-        }]
+    Returns:
+        List of GeoJSON polygon features (coordinates as ndarrays)
+    """
+    return _mask_to_features(
+        mask,
+        image_width,
+        image_height,
+        bounds,
+        affine=affine,
+        simplify_tolerance=simplify_tolerance,
+        validate=validate,
+        packed=packed,
+        mask_width=mask_width
+    )
 
 
 def convert_sam3_results_to_geojson(
@@ -209,6 +504,18 @@ def convert_sam3_results_to_geojson(
     """
     features = []
     
+    # The pixel -> geo transform is the same for every mask in the image
+    affine = affine_params(image_width, image_height, bounds)
+    packed = results.get("masks_packed", False)
+    mask_width = results.get("masks_width", image_width)
+    if packed and mask_width != image_width:
+        logger.warning(
+            "Mask width %d differs from image width %d; polygons may be misplaced",
+            mask_width, image_width
+        )
+    
+    # Flatten to one (mask, properties) job per detection
+    jobs = []
     for i, prompt in enumerate(results.get("prompts", [])):
         masks = results.get("masks", [])[i] if i < len(results.get("masks", [])) else []
         scores = results.get("scores", [])[i] if i < len(results.get("scores", [])) else []
@@ -216,23 +523,34 @@ def convert_sam3_results_to_geojson(
         
         for j, mask in enumerate(masks):
             score = scores[j] if j < len(scores) else 0.5
-            
-            # Convert mask to polygons
-            polygons = mask_to_polygons(
-                mask,
-                image_width,
-                image_height,
-                bounds
-            )
-            
-            # Add metadata to each polygon
-            for poly in polygons:
-                poly["properties"] = {
-                    "prompt": prompt,
-                    "confidence": float(score),
-                    "color": color
-                }
-                features.append(poly)
+            jobs.append((mask, {
+                "prompt": prompt,
+                "confidence": float(score),
+                "color": color
+            }))
+    
+    def convert(job):
+        mask, properties = job
+        # Convert mask straight to features with metadata attached
+        return _mask_to_features(
+            mask,
+            image_width,
+            image_height,
+            bounds,
+            affine=affine,
+            properties=properties,
+            packed=packed,
+            mask_width=mask_width
+        )
+    
+    # OpenCV and NumPy release the GIL, so masks convert in parallel threads
+    if len(jobs) >= PARALLEL_MIN_MASKS and MAX_CONVERSION_WORKERS > 1:
+        feature_lists = list(_get_conversion_executor().map(convert, jobs))
+    else:
+        feature_lists = [convert(job) for job in jobs]
+    
+    for feature_list in feature_lists:
+        features.extend(feature_list)
     
     return {
         "type": "FeatureCollection",
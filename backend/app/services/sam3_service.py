@@ -1,12 +1,19 @@
+import logging
 import os
 from typing import List, Dict, Any, Optional
 from PIL import Image
 import numpy as np
 import random
+import threading
+
+logger = logging.getLogger(__name__)
 
 # Enable mock mode for UI testing when model can't load
 MOCK_MODE = os.getenv("SAM3_MOCK_MODE", "true").lower() == "true"
 
+# Guards creation of the SAM3Service singleton
+_instance_lock = threading.Lock()
+
 class SAM3Service:
     """Service for loading and using SAM3 model for image segmentation"""
     
@@ -15,17 +22,23 @@ class SAM3Service:
     _processor = None
     _model_loaded = False
     _use_mock = False
+    # The model is not re-entrant; serialize inference across worker threads
+    _inference_lock = threading.Lock()
     
     def __init__(self):
         if SAM3Service._instance is not None:
             raise Exception("SAM3Service is a singleton. Use get_instance() instead.")
         self.model_path = os.getenv("SAM3_MODEL_PATH", "./models/sam3_image_model.pt")
+        # Ensures concurrent first requests don't both load the model
+        self._load_lock = threading.Lock()
     
     @classmethod
     def get_instance(cls) -> 'SAM3Service':
         """Get singleton instance of SAM3Service"""
         if cls._instance is None:
-            cls._instance = cls()
+            with _instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
         return cls._instance
     
     def load_model(self):
@@ -33,20 +46,27 @@ class SAM3Service:
         if self._model_loaded:
             return
         
+        with self._load_lock:
+            if self._model_loaded:
+                return
+            self._load_model()
+    
+    def _load_model(self):
+        """Load SAM3 model and processor; caller must hold _load_lock"""
         try:
             import torch
             from sam3.model_builder import build_sam3_image_model
             from sam3.model.sam3_image_processor import Sam3Processor
             
-            print("Loading SAM3 model...")
+            logger.info("Loading SAM3 model...")
             # Use CPU for macOS compatibility
             device = "cuda" if torch.cuda.is_available() else "cpu"
-            print(f"Using device: {device}")
+            logger.info("Using device: %s", device)
             self._model = build_sam3_image_model(device=device)
             
             # Load checkpoint if path exists
             if os.path.exists(self.model_path):
-                print(f"Loading checkpoint from {self.model_path}")
+                logger.info("Loading checkpoint from %s", self.model_path)
                 checkpoint = torch.load(self.model_path, map_location="cpu")
                 if "model" in checkpoint:
                     self._model.load_state_dict(checkpoint["model"])
@@ -55,23 +75,37 @@ class SAM3Service:
             
             self._processor = Sam3Processor(self._model, device=device)
             self._model_loaded = True
-            print("SAM3 model loaded successfully")
+            logger.info("SAM3 model loaded successfully")
             
             # Verify model has parameters
             total_params = sum(p.numel() for p in self._model.parameters())
-            print(f"SAM3 model has {total_params:,} parameters")
+            logger.info("SAM3 model has %s parameters", f"{total_params:,}")
         except ImportError as e:
-            print(f"Warning: SAM3 not installed. Install with: pip install -e . from sam3 repo")
-            print(f"Error: {e}")
+            logger.warning("SAM3 not installed. Install with: pip install -e . from sam3 repo")
+            logger.warning("Error: %s", e)
             self._model_loaded = False
         except Exception as e:
-            print(f"Error loading SAM3 model: {e}")
+            logger.error("Error loading SAM3 model: %s", e)
             self._model_loaded = False
             if MOCK_MODE:
-                print("MOCK MODE ENABLED: Will return simulated detection results for UI testing")
+                logger.warning("MOCK MODE ENABLED: Will return simulated detection results for UI testing")
                 self._use_mock = True
                 self._model_loaded = True  # Pretend it's loaded for mock mode
     
+    def warm_up(self):
+        """Load the model and run a tiny dummy inference so the first request is fast"""
+        self.load_model()
+        if not self._model_loaded or self._use_mock:
+            return
+        
+        try:
+            # The processor resizes to its own resolution, so a 64x64 image
+            # still exercises the same kernels as a real request
+            self.process_image(Image.new("RGB", (64, 64)), ["object"])
+            logger.info("SAM3 warm-up inference complete")
+        except Exception as e:
+            logger.warning("SAM3 warm-up inference failed: %s", e)
+    
     def is_model_loaded(self) -> bool:
         """Check if model is loaded"""
         return self._model_loaded
@@ -88,7 +122,11 @@ class SAM3Service:
             "prompts": [],
             "masks": [],
             "boxes": [],
-            "scores": []
+            "scores": [],
+            # Masks are bit-packed along the width axis (see np.packbits);
+            # masks_width is the unpacked width needed to restore them
+            "masks_packed": True,
+            "masks_width": image.size[0]
         }
         
         for prompt in prompts:
@@ -117,16 +155,16 @@ class SAM3Service:
                     prompt_scores.append(score)
                     
                     # Create a simple rectangular mask
-                    mask = np.zeros((height, width), dtype=np.uint8)
-                    mask[int(y1*height):int(y2*height), int(x1*width):int(x2*width)] = 255
-                    prompt_masks.append(mask)
+                    mask = np.zeros((height, width), dtype=bool)
+                    mask[int(y1*height):int(y2*height), int(x1*width):int(x2*width)] = True
+                    prompt_masks.append(np.packbits(mask, axis=-1))
             
             results["prompts"].append(prompt)
             results["masks"].append(prompt_masks)
             results["boxes"].append(prompt_boxes)
             results["scores"].append(prompt_scores)
         
-        print(f"MOCK: Generated {sum(len(s) for s in results['scores'])} detections for {len(prompts)} prompts")
+        logger.debug("MOCK: Generated %d detections for %d prompts", sum(len(s) for s in results['scores']), len(prompts))
         return results
     
     def process_image(
@@ -144,7 +182,9 @@ class SAM3Service:
             confidence_threshold: Minimum confidence score
             
         Returns:
-            Dictionary with masks, boxes, and scores for each prompt
+            Dictionary with masks, boxes, and scores for each prompt. Masks
+            are bit-packed uint8 arrays of shape (H, ceil(W / 8)), with the
+            unpacked width W stored under "masks_width".
         """
         if not self._model_loaded:
             self.load_model()
@@ -156,37 +196,51 @@ class SAM3Service:
         if self._use_mock:
             return self._generate_mock_results(image, prompts, confidence_threshold)
         
+        with self._inference_lock:
+            return self._process_image_locked(image, prompts, confidence_threshold)
+    
+    def _process_image_locked(
+        self,
+        image: Image.Image,
+        prompts: List[str],
+        confidence_threshold: float
+    ) -> Dict[str, Any]:
+        """Run SAM3 inference; caller must hold _inference_lock"""
         results = {
             "prompts": [],
             "masks": [],
             "boxes": [],
-            "scores": []
+            "scores": [],
+            # Masks are bit-packed along the width axis (see np.packbits);
+            # masks_width is the unpacked width needed to restore them
+            "masks_packed": True,
+            "masks_width": image.size[0]
         }
         
         # Set image in processor
         inference_state = self._processor.set_image(image)
-        print(f"Image set in processor. Original size: {inference_state.get('original_width')}x{inference_state.get('original_height')}")
+        logger.debug("Image set in processor. Original size: %sx%s", inference_state.get('original_width'), inference_state.get('original_height'))
         
         # Set confidence threshold to 0 to get ALL detections
         # We'll filter later based on user's threshold
         self._processor.confidence_threshold = 0.0
-        print(f"Processor confidence threshold set to: {self._processor.confidence_threshold}")
+        logger.debug("Processor confidence threshold set to: %s", self._processor.confidence_threshold)
         
         # Debug: Check model state
-        print(f"Model device: {self._processor.device}")
-        print(f"Model resolution: {self._processor.resolution}")
+        logger.debug("Model device: %s", self._processor.device)
+        logger.debug("Model resolution: %s", self._processor.resolution)
         
         # Process each prompt
         for prompt in prompts:
             try:
-                print(f"Processing prompt: '{prompt}'")
+                logger.debug("Processing prompt: '%s'", prompt)
                 output = self._processor.set_text_prompt(
                     state=inference_state,
                     prompt=prompt
                 )
                 
-                # Debug: print all keys in output
-                print(f"  Output keys: {list(output.keys())}")
+                # Debug: log all keys in output
+                logger.debug("  Output keys: %s", list(output.keys()))
                 
                 # Extract and convert tensors to numpy arrays/lists
                 import torch
@@ -195,30 +249,46 @@ class SAM3Service:
                 boxes_raw = output.get("boxes", None)
                 scores_raw = output.get("scores", None)
                 
-                # Debug: print raw shapes
-                if masks_raw is not None and torch.is_tensor(masks_raw):
-                    print(f"  Raw masks shape: {masks_raw.shape}")
-                else:
-                    print(f"  Raw masks: {type(masks_raw)}")
+                # Debug: log raw shapes (skipped entirely above DEBUG since
+                # peeking at the scores forces a device -> host copy)
+                if logger.isEnabledFor(logging.DEBUG):
+                    if masks_raw is not None and torch.is_tensor(masks_raw):
+                        logger.debug("  Raw masks shape: %s", masks_raw.shape)
+                    else:
+                        logger.debug("  Raw masks: %s", type(masks_raw))
                     
-                if boxes_raw is not None and torch.is_tensor(boxes_raw):
-                    print(f"  Raw boxes shape: {boxes_raw.shape}")
-                else:
-                    print(f"  Raw boxes: {type(boxes_raw)}")
+                    if boxes_raw is not None and torch.is_tensor(boxes_raw):
+                        logger.debug("  Raw boxes shape: %s", boxes_raw.shape)
+                    else:
+                        logger.debug("  Raw boxes: %s", type(boxes_raw))
                     
-                if scores_raw is not None and torch.is_tensor(scores_raw):
-                    print(f"  Raw scores shape: {scores_raw.shape}, values: {scores_raw.cpu().tolist()[:5] if len(scores_raw) > 0 else 'empty'}")
-                else:
-                    print(f"  Raw scores: {type(scores_raw)}")
+                    if scores_raw is not None and torch.is_tensor(scores_raw):
+                        logger.debug("  Raw scores shape: %s, values: %s", scores_raw.shape, scores_raw[:5].cpu().tolist() if len(scores_raw) > 0 else 'empty')
+                    else:
+                        logger.debug("  Raw scores: %s", type(scores_raw))
+                
+                # Apply the confidence threshold on-device so only kept
+                # detections are copied to the CPU. This is only safe when
+                # scores, boxes and masks are all tensors with one row per
+                # detection, so all three can be filtered together.
+                if (torch.is_tensor(scores_raw) and scores_raw.dim() == 1
+                        and torch.is_tensor(boxes_raw) and boxes_raw.dim() == 2
+                        and torch.is_tensor(masks_raw) and masks_raw.dim() >= 3
+                        and boxes_raw.shape[0] == scores_raw.shape[0]
+                        and masks_raw.shape[0] == scores_raw.shape[0]):
+                    keep = scores_raw >= confidence_threshold
+                    scores_raw = scores_raw[keep]
+                    boxes_raw = boxes_raw[keep]
+                    masks_raw = masks_raw[keep]
                 
-                # Convert scores to list
+                # Convert scores to a 1D numpy array
                 if scores_raw is not None:
                     if torch.is_tensor(scores_raw):
-                        scores = scores_raw.cpu().tolist()
+                        scores = scores_raw.cpu().numpy().reshape(-1)
                     else:
-                        scores = list(scores_raw) if hasattr(scores_raw, '__iter__') else [scores_raw]
+                        scores = np.atleast_1d(np.asarray(scores_raw, dtype=np.float64))
                 else:
-                    scores = []
+                    scores = np.empty(0)
                 
                 # Convert boxes to list of lists
                 boxes = []
@@ -231,7 +301,7 @@ class SAM3Service:
                         elif boxes_tensor.dim() == 1 and len(boxes_tensor) == 4:
                             boxes = [boxes_tensor.tolist()]
                         else:
-                            print(f"Warning: Unexpected box shape: {boxes_tensor.shape}")
+                            logger.warning("Unexpected box shape: %s", boxes_tensor.shape)
                             boxes = []
                     else:
                         boxes = list(boxes_raw) if hasattr(boxes_raw, '__iter__') else []
@@ -249,10 +319,11 @@ class SAM3Service:
                         elif masks_tensor.dim() == 2:  # [H, W] - single mask
                             masks_tensor = masks_tensor.unsqueeze(0)  # [1, H, W]
                         
-                        # Convert to numpy boolean arrays
-                        for i in range(masks_tensor.shape[0]):
-                            mask_np = masks_tensor[i].numpy().astype(bool)
-                            masks.append(mask_np)
+                        # Convert to numpy boolean arrays and bit-pack them in
+                        # one shot; each mask is a view into the same buffer
+                        masks_all = masks_tensor.numpy().astype(bool, copy=False)
+                        results["masks_width"] = masks_all.shape[-1]
+                        masks = list(np.packbits(masks_all, axis=-1))
                     elif isinstance(masks_raw, (list, tuple)):
                         for mask in masks_raw:
                             if torch.is_tensor(mask):
@@ -264,17 +335,18 @@ class SAM3Service:
                                 masks.append(mask.astype(bool))
                             else:
                                 masks.append(np.array(mask, dtype=bool))
+                        if masks:
+                            results["masks_width"] = masks[0].shape[-1]
+                        masks = [np.packbits(m, axis=-1) for m in masks]
                 
-                # Filter by confidence threshold
+                # Filter by confidence threshold (selects everything if the
+                # outputs were already filtered on-device above)
                 if len(scores) > 0:
-                    filtered_indices = [
-                        i for i, score in enumerate(scores) 
-                        if score >= confidence_threshold
-                    ]
+                    keep_idx = np.flatnonzero(scores >= confidence_threshold)
                     
-                    filtered_masks = [masks[i] for i in filtered_indices] if masks and len(masks) > 0 else []
-                    filtered_boxes = [boxes[i] for i in filtered_indices] if boxes and len(boxes) > 0 else []
-                    filtered_scores = [scores[i] for i in filtered_indices]
+                    filtered_masks = [masks[i] for i in keep_idx] if len(masks) > 0 else []
+                    filtered_boxes = [boxes[i] for i in keep_idx] if len(boxes) > 0 else []
+                    filtered_scores = scores[keep_idx].tolist()
                 else:
                     filtered_masks = []
                     filtered_boxes = []
@@ -286,7 +358,7 @@ class SAM3Service:
                 results["scores"].append(filtered_scores)
                 
             except Exception as e:
-                print(f"Error processing prompt '{prompt}': {e}")
+                logger.error("Error processing prompt '%s': %s", prompt, e)
                 results["prompts"].append(prompt)
                 results["masks"].append([])
                 results["boxes"].append([])